@@ -0,0 +1,72 @@
+import json
+import timeit
+import tracemalloc
+import numpy as np
+import pandas as pd
+from progn import parse_json_pairs, build_price_frame
+
+# Сравнение разбора ответа market_chart: прежний путь через json + merge
+# и колоночный путь через массивы NumPy
+
+# Размеры ответов CoinGecko: 5-минутные данные за сутки, часовые за 90 дней,
+# дневные за 365 дней
+PAYLOADS = {
+    '5min_1d': (288, 300_000),
+    'hourly_90d': (2160, 3_600_000),
+    'daily_365d': (366, 86_400_000),
+}
+REPEAT = 200
+
+# Функция для создания ответа в формате market_chart
+def make_payload(points, step_ms, seed=0):
+    rng = np.random.default_rng(seed)
+    timestamps = 1_700_000_000_000 + np.arange(points) * step_ms
+    prices = 30000 * np.exp(np.cumsum(rng.normal(0, 0.01, points)))
+    volumes = rng.uniform(1e10, 3e10, points)
+    data = {
+        'prices': [[int(t), float(p)] for t, p in zip(timestamps, prices)],
+        'market_caps': [[int(t), float(p) * 19e6] for t, p in zip(timestamps, prices)],
+        'total_volumes': [[int(t), float(v)] for t, v in zip(timestamps, volumes)],
+    }
+    return json.dumps(data).encode('utf-8')
+
+# Прежний путь разбора (до колоночного)
+def legacy_price_frame(content):
+    data = json.loads(content)
+    df_prices = pd.DataFrame(data['prices'], columns=['timestamp', 'price'])
+    df_volumes = pd.DataFrame(data['total_volumes'], columns=['timestamp', 'volume'])
+    df = pd.merge(df_prices, df_volumes, on='timestamp')
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+    df.set_index('timestamp', inplace=True)
+    df['high'] = df['price']
+    df['low'] = df['price']
+    return df
+
+# Колоночный путь разбора
+def columnar_price_frame(content):
+    prices = parse_json_pairs(content, b'prices')
+    volumes = parse_json_pairs(content, b'total_volumes')
+    return build_price_frame(prices, volumes)
+
+# Функция для измерения пикового объема выделенной памяти (в КБ)
+def peak_memory(func, content):
+    tracemalloc.start()
+    func(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+def main():
+    print(f"{'payload':<12} {'path':<9} {'time, ms':>9} {'peak, KB':>9}")
+    for name, (points, step_ms) in PAYLOADS.items():
+        content = make_payload(points, step_ms)
+        # Оба пути должны давать одинаковые данные
+        pd.testing.assert_frame_equal(
+            legacy_price_frame(content), columnar_price_frame(content), check_freq=False
+        )
+        for path, func in (('legacy', legacy_price_frame), ('columnar', columnar_price_frame)):
+            seconds = min(timeit.repeat(lambda: func(content), number=REPEAT, repeat=5)) / REPEAT
+            print(f"{name:<12} {path:<9} {seconds * 1000:>9.3f} {peak_memory(func, content):>9.1f}")
+
+if __name__ == '__main__':
+    main()
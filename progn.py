@@ -2,8 +2,21 @@ import requests
 import pandas as pd
 import numpy as np
 import logging
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+import heapq
+import time
+import os
+import sys
+import socket
+import json
+import asyncio
+import bisect
+import hashlib
+import sqlite3
+import threading
+from collections import deque
+from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
+    Application,
     ApplicationBuilder,
     CommandHandler,
     ContextTypes,
@@ -17,6 +30,9 @@ from ta.momentum import RSIIndicator, StochasticOscillator
 from ta.trend import MACD, CCIIndicator, EMAIndicator, ADXIndicator
 from ta.volume import OnBalanceVolumeIndicator
 from scipy.signal import argrelextrema
+import nltk
+import websockets
+from nltk.sentiment.vader import SentimentIntensityAnalyzer
 import warnings
 
 warnings.filterwarnings('ignore')
@@ -38,6 +54,90 @@ TELEGRAM_BOT_TOKEN = 'YOUR_TELEGRAM_BOT_TOKEN'
     CONFIRM_SIGNAL,
 ) = range(5)
 
+# Параметры адаптивного планировщика сигналов (в секундах)
+SIGNAL_SCHEDULER_TICK = 30
+MIN_SIGNAL_CHECK_INTERVAL = 60
+# Максимальный интервал проверки монеты в зависимости от самого короткого таймфрейма
+TIME_FRAME_CHECK_INTERVALS = {
+    '1h': 300,
+    '4h': 900,
+    '12h': 1800,
+    '24h': 3600,
+}
+# Шаг 5-минутных данных CoinGecko и запас по времени до срабатывания порога
+PRICE_BAR_SECONDS = 300
+SIGNAL_CHECK_SAFETY_FACTOR = 0.25
+
+# Общее хранилище для шардированной обработки сигналов несколькими процессами
+SIGNAL_SHARD_DB = 'signals.db'
+# Воркер считается живым, пока его heartbeat свежее этого срока (в секундах)
+SIGNAL_SHARD_LEASE = 180
+# Количество виртуальных узлов на воркер в кольце консистентного хеширования
+SIGNAL_SHARD_VNODES = 64
+
+# Максимальное число одновременно обрабатываемых обновлений (от разных пользователей)
+UPDATE_CONCURRENCY_LIMIT = 8
+# Порог ожидания обновления в очереди пользователя для записи в лог (в секундах)
+SLOW_UPDATE_WAIT = 1.0
+# Интервал отчета об очередях обновлений (в секундах)
+UPDATE_QUEUE_REPORT_INTERVAL = 600
+
+# Уровни пирамиды цен: правило агрегации, глубина загрузки из API,
+# глубина хранения и количество баров в сутках
+PRICE_LEVELS = {
+    '5min': {'rule': None, 'fetch_days': 1, 'keep_days': 2, 'bars_per_day': 288},
+    '1h': {'rule': '1h', 'fetch_days': 90, 'keep_days': 90, 'bars_per_day': 24},
+    '1d': {'rule': '1D', 'fetch_days': 365, 'keep_days': 365, 'bars_per_day': 1},
+}
+PRICE_LEVEL_ORDER = ['5min', '1h', '1d']
+# Как часто обновлять самый мелкий уровень пирамиды (в секундах)
+PRICE_PYRAMID_REFRESH = 60
+# Больший промежуток между сохраненными и свежими 5-минутными данными считается разрывом
+PRICE_GAP_TOLERANCE = pd.Timedelta(minutes=15)
+# Глубина истории для прогноза в единицах горизонта прогноза
+FORECAST_HISTORY_FACTOR = 10
+
+# Параметры вероятностного прогноза методом Монте-Карло
+MONTE_CARLO_PATHS = 10000
+# Бары горизонта объединяются, чтобы число шагов симуляции не превышало этого значения
+MONTE_CARLO_MAX_STEPS = 100
+# Брать доходности из исторического ряда вместо нормального распределения
+MONTE_CARLO_BOOTSTRAP = False
+# Бюджет времени на симуляцию (в секундах)
+MONTE_CARLO_BUDGET = 0.05
+
+# Параметры анализа настроения новостей
+NEWS_REFRESH_INTERVAL = 600
+# Окно скользящего агрегата настроения по монете (в секундах)
+NEWS_WINDOW = 24 * 3600
+# Локальный файл с заголовками для тестов (JSON Lines: {"coin": ..., "title": ...,
+# "published": ...}); None - источник отключен
+NEWS_FILE = None
+# Среднее настроение внутри этой полосы считается нейтральным
+NEWS_NEUTRAL_BAND = 0.05
+
+# Источник цен для мгновенной проверки сигналов: 'binance', 'poll' или 'simulated'
+PRICE_SOURCE = 'binance'
+# Интервал опроса цен для источника 'poll' (в секундах)
+PRICE_POLL_INTERVAL = 10
+# Шаг хранения истории тиков и ее глубина (в секундах)
+STREAM_HISTORY_SPACING = 5
+STREAM_HISTORY_SECONDS = 24 * 3600
+# Если тиков по монете нет дольше этого срока, ее снова проверяет планировщик
+STREAM_STALE_SECONDS = 60
+
+# Допуск запросов прогноза: сколько прогнозов считается одновременно
+# и сколько пользователей может ждать в очереди
+FORECAST_CONCURRENCY_LIMIT = 2
+FORECAST_QUEUE_LIMIT = 10
+
+TIME_FRAME_DELTAS = {
+    '1h': pd.Timedelta(hours=1),
+    '4h': pd.Timedelta(hours=4),
+    '12h': pd.Timedelta(hours=12),
+    '24h': pd.Timedelta(hours=24),
+}
+
 # Функция для получения индекса страха и жадности
 def get_fear_and_greed_index():
     url = 'https://api.alternative.me/fng/'
@@ -88,30 +188,337 @@ def get_price_data(coin, days=365):
     try:
         response = requests.get(url, params=params, timeout=10)
         response.raise_for_status()
-        data = response.json()
-        if 'prices' not in data or 'total_volumes' not in data:
-            logging.error(f"Prices or volumes not in data: {data}")
-            return None
-        prices = data['prices']
-        volumes = data['total_volumes']
-        df_prices = pd.DataFrame(prices, columns=['timestamp', 'price'])
-        df_volumes = pd.DataFrame(volumes, columns=['timestamp', 'volume'])
-        df = pd.merge(df_prices, df_volumes, on='timestamp')
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        df.set_index('timestamp', inplace=True)
-        # Добавляем столбцы high и low для некоторых индикаторов
-        df['high'] = df['price']
-        df['low'] = df['price']
-        return df
+        # Разбираем массивы цен и объемов сразу в NumPy, без объектов Python
+        prices = parse_json_pairs(response.content, b'prices')
+        volumes = parse_json_pairs(response.content, b'total_volumes')
+        if prices is None or volumes is None:
+            # Резервный путь через полный разбор JSON
+            data = response.json()
+            if 'prices' not in data or 'total_volumes' not in data:
+                logging.error(f"Prices or volumes not in data: {data}")
+                return None
+            prices = np.array(data['prices'], dtype=np.float64).reshape(-1, 2)
+            volumes = np.array(data['total_volumes'], dtype=np.float64).reshape(-1, 2)
+        return build_price_frame(prices, volumes)
     except Exception as e:
         logging.error(f"Error fetching price data: {e}")
         return None
 
-# Функция для получения настроения новостей (заглушка)
+# Функция для разбора массива пар [timestamp, value] из JSON-ответа в массив (n, 2)
+def parse_json_pairs(content, key):
+    start = content.find(b'"' + key + b'"')
+    if start == -1:
+        return None
+    start = content.find(b'[', start)
+    if start == -1:
+        return None
+    if content[start + 1:start + 64].lstrip().startswith(b']'):
+        return np.empty((0, 2))
+    # Пары не содержат вложенных массивов, поэтому массив заканчивается на первом "]]"
+    end = content.find(b']]', start)
+    if end == -1:
+        return None
+    segment = content[start:end + 2].translate(None, b'[] \t\r\n')
+    if b'null' in segment:
+        return None
+    values = np.fromstring(segment.decode('ascii'), dtype=np.float64, sep=',')
+    if values.size % 2 or values.size != segment.count(b',') + 1:
+        return None
+    return values.reshape(-1, 2)
+
+# Функция для построения DataFrame цен из массивов пар без объединения таблиц
+def build_price_frame(prices, volumes):
+    if len(prices) == len(volumes) and np.array_equal(prices[:, 0], volumes[:, 0]):
+        timestamps = prices[:, 0]
+        price = np.ascontiguousarray(prices[:, 1])
+        volume = np.ascontiguousarray(volumes[:, 1])
+    else:
+        # Метки времени не совпали: оставляем только общие, как при внутреннем объединении
+        timestamps, price_idx, volume_idx = np.intersect1d(
+            prices[:, 0], volumes[:, 0], return_indices=True
+        )
+        price = prices[price_idx, 1]
+        volume = volumes[volume_idx, 1]
+    index = pd.DatetimeIndex(
+        pd.to_datetime(timestamps.astype(np.int64), unit='ms'), name='timestamp'
+    )
+    # Столбцы high и low для некоторых индикаторов ссылаются на тот же массив, что и price
+    return pd.DataFrame(
+        {'price': price, 'volume': volume, 'high': price, 'low': price},
+        index=index,
+        copy=False,
+    )
+
+# Пирамида цен по монетам: {coin: {'updated': ..., '5min': df, '1h': df, '1d': df}}
+price_pyramid = {}
+price_pyramid_locks = {}
+
+# Функция для агрегации данных о цене в более крупные бары
+def downsample_price_data(df, rule):
+    resampled = df.resample(rule).agg(
+        {'price': 'last', 'volume': 'last', 'high': 'max', 'low': 'min'}
+    )
+    return resampled.dropna(subset=['price'])
+
+# Функция для обновления уровней пирамиды цен монеты до уровня level включительно.
+# Более крупные уровни загружаются из API только при первом запросе к ним
+def update_price_pyramid(coin, level=PRICE_LEVEL_ORDER[-1]):
+    lock = price_pyramid_locks.setdefault(coin, threading.Lock())
+    with lock:
+        levels = price_pyramid.setdefault(coin, {'updated': None})
+        stale = (
+            levels['updated'] is None
+            or time.monotonic() - levels['updated'] >= PRICE_PYRAMID_REFRESH
+        )
+        if not stale and levels.get(level) is not None:
+            return levels
+        if stale:
+            fresh = get_price_data(coin, days=PRICE_LEVELS['5min']['fetch_days'])
+            if fresh is None or fresh.empty:
+                return levels
+            # Самый мелкий уровень дополняем свежими 5-минутными данными
+            finest = levels.get('5min')
+            if finest is not None and not finest.empty:
+                if fresh.index[0] - finest.index[-1] > PRICE_GAP_TOLERANCE:
+                    # Между сохраненными и свежими данными разрыв: старые данные отбрасываем
+                    # вместе с более крупными уровнями, они заново загрузятся из API
+                    logging.info(f"Price data gap for {coin}, reloading coarser levels")
+                    for name in PRICE_LEVEL_ORDER[1:]:
+                        levels.pop(name, None)
+                else:
+                    fresh = pd.concat([finest[finest.index < fresh.index[0]], fresh])
+            keep_from = fresh.index[-1] - pd.Timedelta(days=PRICE_LEVELS['5min']['keep_days'])
+            levels['5min'] = fresh[fresh.index >= keep_from]
+            levels['updated'] = time.monotonic()
+        finer = levels['5min']
+        last_level = PRICE_LEVEL_ORDER.index(level)
+        # Более крупные уровни строим из более мелких, пересчитывая только хвост
+        for position, name in enumerate(PRICE_LEVEL_ORDER[1:], start=1):
+            level_params = PRICE_LEVELS[name]
+            coarse = levels.get(name)
+            if coarse is None or coarse.empty or finer.index[0] > coarse.index[-1]:
+                if position > last_level:
+                    # Уровень не нужен вызывающему: загрузим его при первом запросе
+                    break
+                # Первое заполнение или разрыв в данных: загружаем уровень из API
+                seeded = get_price_data(coin, days=level_params['fetch_days'])
+                if seeded is None or seeded.empty:
+                    break
+                coarse = downsample_price_data(seeded, level_params['rule'])
+            if finer.index[0] <= coarse.index[-1]:
+                # Последний бар уровня мог быть неполным, пересчитываем с него
+                tail_start = coarse.index[-1]
+                tail = downsample_price_data(finer[finer.index >= tail_start], level_params['rule'])
+                coarse = pd.concat([coarse[coarse.index < tail_start], tail])
+            keep_from = coarse.index[-1] - pd.Timedelta(days=level_params['keep_days'])
+            coarse = coarse[coarse.index >= keep_from]
+            levels[name] = coarse
+            finer = coarse
+        return levels
+
+# Функция для получения копии уровня пирамиды цен
+def get_price_level(coin, level):
+    df = update_price_pyramid(coin, level).get(level)
+    if df is None:
+        return None
+    return df.copy()
+
+# Функция для выбора самого мелкого уровня, покрывающего нужную глубину истории
+def select_price_level(history):
+    for name in PRICE_LEVEL_ORDER:
+        if pd.Timedelta(days=PRICE_LEVELS[name]['keep_days']) >= history:
+            return name
+    return PRICE_LEVEL_ORDER[-1]
+
+# Функция для получения данных о цене для прогноза на forecast_days дней
+def get_forecast_price_data(coin, forecast_days):
+    # Выбираем самый мелкий уровень, на котором помещается окно анализа
+    for level in PRICE_LEVEL_ORDER:
+        bars_per_day = PRICE_LEVELS[level]['bars_per_day']
+        window = get_analysis_window(forecast_days, bars_per_day)
+        if window <= PRICE_LEVELS[level]['keep_days'] * bars_per_day:
+            break
+    df = update_price_pyramid(coin, level).get(level)
+    if df is None or df.empty:
+        return None, bars_per_day
+    # Копируем только нужное окно (+1 бар для первой доходности)
+    return df.iloc[-(window + 1):].copy(), bars_per_day
+
+# Модель настроения загружается один раз на процесс
+sentiment_analyzer = None
+# Оценки заголовков по хешу и скользящие агрегаты настроения по монетам
+news_score_cache = {}
+news_sentiment = {}
+news_lock = threading.Lock()
+
+# Функция для получения модели настроения (словарь VADER из nltk)
+def get_sentiment_analyzer():
+    global sentiment_analyzer
+    if sentiment_analyzer is None:
+        try:
+            sentiment_analyzer = SentimentIntensityAnalyzer()
+        except LookupError:
+            nltk.download('vader_lexicon', quiet=True)
+            sentiment_analyzer = SentimentIntensityAnalyzer()
+    return sentiment_analyzer
+
+# Функция для получения заголовков новостей CryptoCompare
+def fetch_cryptocompare_headlines(coin_dict):
+    url = 'https://min-api.cryptocompare.com/data/v2/news/'
+    try:
+        response = requests.get(url, params={'lang': 'EN'}, timeout=10)
+        response.raise_for_status()
+        data = response.json()
+        headlines = []
+        for article in data.get('Data', []):
+            # Категории новости содержат тикеры монет, например "BTC|Trading"
+            for ticker in article.get('categories', '').split('|'):
+                coin = coin_dict.get(ticker.upper())
+                if coin:
+                    headlines.append(
+                        {
+                            'coin': coin,
+                            'title': article['title'],
+                            'published': article['published_on'],
+                        }
+                    )
+        return headlines
+    except Exception as e:
+        logging.error(f"Error fetching news headlines: {e}")
+        return []
+
+# Функция для чтения заголовков из локального файла
+def load_file_headlines(coin_dict):
+    try:
+        with open(NEWS_FILE, encoding='utf-8') as f:
+            lines = [line for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+    headlines = []
+    for line in lines:
+        try:
+            item = json.loads(line)
+        except ValueError:
+            logging.error(f"Skipping malformed news line: {line.strip()[:100]}")
+            continue
+        if not isinstance(item, dict):
+            continue
+        coin = str(item.get('coin', ''))
+        headlines.append(
+            {
+                'coin': coin_dict.get(coin.upper(), coin),
+                'title': item.get('title'),
+                'published': item.get('published', time.time()),
+            }
+        )
+    return headlines
+
+# Источники заголовков: функции, принимающие coin_dict и возвращающие список новостей
+NEWS_SOURCES = [fetch_cryptocompare_headlines]
+if NEWS_FILE:
+    NEWS_SOURCES.append(load_file_headlines)
+
+# Функция для проверки новости: возвращает нормализованную запись или None
+def validate_headline(item):
+    if not isinstance(item, dict):
+        return None
+    title = item.get('title')
+    coin = item.get('coin')
+    if not isinstance(title, str) or not title.strip() or not isinstance(coin, str) or not coin:
+        return None
+    try:
+        published = float(item.get('published'))
+    except (TypeError, ValueError):
+        return None
+    if not np.isfinite(published):
+        return None
+    return {'coin': coin, 'title': title, 'published': published}
+
+# Функция для удаления устаревших новостей из агрегата монеты
+def expire_news(aggregate, now):
+    items = aggregate['items']
+    while items and now - items[0][0] > NEWS_WINDOW:
+        _, _, score = items.popleft()
+        aggregate['sum'] -= score
+
+# Функция для оценки новых заголовков и обновления агрегатов
+def ingest_headlines(headlines):
+    now = time.time()
+    # Некорректные новости пропускаем по одной, не теряя остальные
+    valid = [item for item in map(validate_headline, headlines) if item is not None]
+    if len(valid) < len(headlines):
+        logging.warning(f"Skipped {len(headlines) - len(valid)} invalid news headlines")
+    headlines = sorted(
+        (item for item in valid if now - item['published'] <= NEWS_WINDOW),
+        key=lambda item: item['published'],
+    )
+    for item in headlines:
+        item['hash'] = hashlib.sha1(item['title'].encode('utf-8')).hexdigest()
+    # Оцениваем пакетом только заголовки, которых еще нет в кэше
+    new_titles = {
+        item['hash']: item['title']
+        for item in headlines
+        if item['hash'] not in news_score_cache
+    }
+    if new_titles:
+        analyzer = get_sentiment_analyzer()
+        scores = [analyzer.polarity_scores(title)['compound'] for title in new_titles.values()]
+    with news_lock:
+        if new_titles:
+            news_score_cache.update(zip(new_titles, scores))
+        for item in headlines:
+            aggregate = news_sentiment.setdefault(
+                item['coin'], {'items': deque(), 'seen': set(), 'sum': 0.0}
+            )
+            if item['hash'] in aggregate['seen']:
+                continue
+            score = news_score_cache[item['hash']]
+            aggregate['items'].append((item['published'], item['hash'], score))
+            aggregate['sum'] += score
+        # Убираем устаревшие новости и оценки, на которые больше никто не ссылается
+        live_hashes = set()
+        for aggregate in news_sentiment.values():
+            expire_news(aggregate, now)
+            aggregate['seen'] = {news_hash for _, news_hash, _ in aggregate['items']}
+            live_hashes |= aggregate['seen']
+        for news_hash in list(news_score_cache):
+            if news_hash not in live_hashes:
+                del news_score_cache[news_hash]
+
+# Функция для загрузки новостей из всех источников
+def refresh_news_sentiment(coin_dict):
+    headlines = []
+    for source in NEWS_SOURCES:
+        try:
+            headlines.extend(source(coin_dict))
+        except Exception as e:
+            logging.error(f"Error loading news from {source.__name__}: {e}")
+    try:
+        ingest_headlines(headlines)
+    except Exception as e:
+        logging.error(f"Error scoring news headlines: {e}")
+
+# Периодическое обновление настроения новостей
+async def update_news_sentiment(context: ContextTypes.DEFAULT_TYPE):
+    await asyncio.to_thread(refresh_news_sentiment, context.bot_data['coin_dict'])
+
+# Функция для получения настроения новостей из скользящего агрегата
 def get_news_sentiment(coin_name):
-    # Заглушка функции. В реальной реализации используйте API новостей.
-    sentiment_summary = "Нейтральный"
-    sentiment_score = 0
+    with news_lock:
+        aggregate = news_sentiment.get(coin_name)
+        if aggregate is None:
+            count = 0
+        else:
+            expire_news(aggregate, time.time())
+            count = len(aggregate['items'])
+        sentiment_score = aggregate['sum'] / count if count else 0
+    if sentiment_score > NEWS_NEUTRAL_BAND:
+        sentiment_summary = f"Позитивный ({sentiment_score:+.2f}, новостей: {count})"
+    elif sentiment_score < -NEWS_NEUTRAL_BAND:
+        sentiment_summary = f"Негативный ({sentiment_score:+.2f}, новостей: {count})"
+    else:
+        sentiment_summary = "Нейтральный"
+        sentiment_score = 0
     return sentiment_score, sentiment_summary
 
 # Функция для получения клавиатуры главного меню
@@ -122,6 +529,7 @@ def get_main_menu_keyboard():
         [InlineKeyboardButton("📆 Выбрать период", callback_data='select_period')],
         [InlineKeyboardButton("🔔 Настроить сигналы", callback_data='configure_signals')],
         [InlineKeyboardButton("📋 Мои сигналы", callback_data='view_signals')],
+        [InlineKeyboardButton("🎲 Вероятностный прогноз", callback_data='toggle_monte_carlo')],
     ]
     return InlineKeyboardMarkup(keyboard)
 
@@ -135,6 +543,156 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         '👋 Добро пожаловать! Выберите действие:', reply_markup=reply_markup
     )
 
+# Функция для получения состояния допуска запросов прогноза
+def get_forecast_admission(bot_data):
+    if 'forecast_admission' not in bot_data:
+        bot_data['forecast_admission'] = {
+            # Не более одного прогноза на пользователя, поэтому очередь семафора
+            # обслуживает пользователей по очереди
+            'semaphore': asyncio.Semaphore(FORECAST_CONCURRENCY_LIMIT),
+            'in_flight': {},
+            'waiting': 0,
+            'stats': {
+                'started': 0,
+                'completed': 0,
+                'merged': 0,
+                'rejected_busy': 0,
+                'rejected_overload': 0,
+                'failed': 0,
+            },
+        }
+    return bot_data['forecast_admission']
+
+# Функция для расчета текста прогноза
+async def get_forecast_text(coin, period, coin_dict, monte_carlo, thresholds):
+    days_map = {
+        '1_day': 1,
+        '3_days': 3,
+        '5_days': 5,
+        '7_days': 7,
+        '30_days': 30,
+        '365_days': 365,
+    }
+    forecast_days = days_map.get(period, 1)
+    # Получаем данные с самого мелкого уровня пирамиды, покрывающего горизонт.
+    # Загрузка и анализ выполняются в потоке, чтобы не блокировать других пользователей
+    df, bars_per_day = await asyncio.to_thread(get_forecast_price_data, coin, forecast_days)
+    if df is None or df.empty:
+        return "Ошибка при получении данных о цене. Пожалуйста, попробуйте позже."
+    coin_name = coin_dict.get(coin.upper(), coin)
+    prediction = await asyncio.to_thread(
+        analyze_data,
+        df,
+        coin_name,
+        forecast_days=forecast_days,
+        bars_per_day=bars_per_day,
+        monte_carlo=monte_carlo,
+        thresholds=thresholds,
+    )
+    # Получаем тикер монеты
+    coin_ticker = [k for k, v in coin_dict.items() if v == coin]
+    if coin_ticker:
+        coin_ticker = coin_ticker[0]
+    else:
+        coin_ticker = coin.capitalize()
+    return (
+        f"📊 Прогноз для {coin_ticker.upper()} на период {forecast_days} дней:\n"
+        f"{prediction}"
+    )
+
+# Функция для допуска запроса прогноза: повторные нажатия присоединяются к уже
+# запущенному расчету, при перегрузке запрос сразу отклоняется
+async def request_forecast(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    user_id = query.from_user.id
+    admission = get_forecast_admission(context.bot_data)
+    stats = admission['stats']
+    coin = context.user_data.get('selected_coin', 'bitcoin')
+    period = context.user_data.get('selected_period', '1_day')
+    pending = admission['in_flight'].get(user_id)
+    if pending is not None:
+        if pending['key'] == (coin, period):
+            pending['queries'].append(query)
+            stats['merged'] += 1
+            return
+        stats['rejected_busy'] += 1
+        await query.edit_message_text(
+            text="⏳ Дождитесь завершения текущего прогноза.",
+            reply_markup=get_main_menu_keyboard(),
+        )
+        return
+    if admission['waiting'] >= FORECAST_QUEUE_LIMIT:
+        stats['rejected_overload'] += 1
+        logging.warning(f"Forecast for user {user_id} rejected: queue is full")
+        await query.edit_message_text(
+            text="🚦 Сейчас слишком много запросов. Пожалуйста, попробуйте позже.",
+            reply_markup=get_main_menu_keyboard(),
+        )
+        return
+    # Пороги сигналов пользователя по этой монете для вероятностного режима
+    thresholds = sorted(
+        {
+            signal['percentage']
+            for signal in context.user_data.get('signals', [])
+            if signal.get('coin') == coin
+        }
+    )
+    entry = {'key': (coin, period), 'queries': [query]}
+    admission['in_flight'][user_id] = entry
+    admission['waiting'] += 1
+    stats['started'] += 1
+    context.application.create_task(
+        run_forecast(
+            context,
+            user_id,
+            entry,
+            monte_carlo=context.user_data.get('monte_carlo', False),
+            thresholds=thresholds,
+        ),
+        update=update,
+    )
+
+# Расчет прогноза в отдельной задаче с ожиданием свободного слота
+async def run_forecast(context, user_id, entry, monte_carlo, thresholds):
+    admission = get_forecast_admission(context.bot_data)
+    coin, period = entry['key']
+    waiting = True
+    try:
+        try:
+            await entry['queries'][0].edit_message_text(text="⏳ Рассчитываю прогноз...")
+        except Exception as e:
+            logging.error(f"Error showing forecast progress: {e}")
+        async with admission['semaphore']:
+            admission['waiting'] -= 1
+            waiting = False
+            text = await get_forecast_text(
+                coin, period, context.bot_data['coin_dict'], monte_carlo, thresholds
+            )
+        admission['stats']['completed'] += 1
+    except Exception as e:
+        logging.error(f"Error calculating forecast for user {user_id}: {e}")
+        admission['stats']['failed'] += 1
+        text = "Произошла ошибка при расчете прогноза. Пожалуйста, попробуйте позже."
+    finally:
+        if waiting:
+            admission['waiting'] -= 1
+        admission['in_flight'].pop(user_id, None)
+    # Отвечаем на все присоединившиеся нажатия (по одному разу на сообщение)
+    edited = set()
+    for query in entry['queries']:
+        message_key = (
+            (query.message.chat_id, query.message.message_id)
+            if query.message
+            else query.inline_message_id
+        )
+        if message_key in edited:
+            continue
+        edited.add(message_key)
+        try:
+            await query.edit_message_text(text=text, reply_markup=get_main_menu_keyboard())
+        except Exception as e:
+            logging.error(f"Error sending forecast: {e}")
+
 # Обработчик нажатий кнопок
 async def button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
@@ -148,41 +706,7 @@ async def button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     coin_dict = context.bot_data['coin_dict']
 
     if data == 'calculate':
-        coin = context.user_data.get('selected_coin', 'bitcoin')
-        period = context.user_data.get('selected_period', '1_day')
-        days_map = {
-            '1_day': 1,
-            '3_days': 3,
-            '5_days': 5,
-            '7_days': 7,
-            '30_days': 30,
-            '365_days': 365,
-        }
-        forecast_days = days_map.get(period, 1)
-        # Получаем достаточное количество исторических данных для анализа
-        historical_days_needed = 365
-        df = get_price_data(coin, days=historical_days_needed)
-        if df is None or df.empty:
-            await query.edit_message_text(
-                text="Ошибка при получении данных о цене. Пожалуйста, попробуйте позже.",
-                reply_markup=get_main_menu_keyboard(),
-            )
-            return
-        coin_name = coin_dict.get(coin.upper(), coin)
-        prediction = analyze_data(df, coin_name, forecast_days=forecast_days)
-        # Получаем тикер монеты
-        coin_ticker = [k for k, v in coin_dict.items() if v == coin]
-        if coin_ticker:
-            coin_ticker = coin_ticker[0]
-        else:
-            coin_ticker = coin.capitalize()
-        await query.edit_message_text(
-            text=(
-                f"📊 Прогноз для {coin_ticker.upper()} на период {forecast_days} дней:\n"
-                f"{prediction}"
-            ),
-            reply_markup=get_main_menu_keyboard(),
-        )
+        await request_forecast(update, context)
 
     elif data == 'select_coin':
         letters = sorted(set(symbol[0].upper() for symbol in coin_dict.keys()))
@@ -268,6 +792,15 @@ async def button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif data == 'view_signals':
         await view_signals(update, context)
 
+    elif data == 'toggle_monte_carlo':
+        monte_carlo = not context.user_data.get('monte_carlo', False)
+        context.user_data['monte_carlo'] = monte_carlo
+        status = 'включен' if monte_carlo else 'выключен'
+        await query.edit_message_text(
+            text=f"🎲 Вероятностный прогноз {status}.",
+            reply_markup=get_main_menu_keyboard(),
+        )
+
     elif data == 'back_to_main':
         await query.edit_message_text(
             text="👋 Добро пожаловать! Выберите действие:", reply_markup=get_main_menu_keyboard()
@@ -448,6 +981,7 @@ async def confirm_signal(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if 'signals' not in context.user_data:
             context.user_data['signals'] = []
         context.user_data['signals'].append(context.user_data['signal_setup'])
+        mark_signals_changed(context.bot_data)
         context.user_data.pop('signal_setup', None)
         await query.edit_message_text(
             text="✅ Сигнал сохранен.", reply_markup=get_main_menu_keyboard()
@@ -511,6 +1045,7 @@ async def delete_signal(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_signals = context.user_data.get('signals', [])
         if 0 <= idx < len(user_signals):
             user_signals.pop(idx)
+            mark_signals_changed(context.bot_data)
             await query.edit_message_text(
                 text="🗑️ Сигнал удален.", reply_markup=get_main_menu_keyboard()
             )
@@ -519,10 +1054,193 @@ async def delete_signal(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         await query.answer("Неверный выбор.")
 
+# Минимальное количество баров для анализа
+ANALYSIS_MIN_BARS = 100
+# Чувствительность поиска экстремумов для волн Эллиота
+ELLIOTT_ORDER = 5
+# Для паттерна нужно 9 экстремумов, каждый занимает до 2 * order + 1 баров
+ELLIOTT_LOOKBACK = 9 * (2 * ELLIOTT_ORDER + 1)
+
+# Индикатор MACD
+def compute_macd(df):
+    macd = MACD(close=df['price'])
+    return {'MACD': macd.macd(), 'MACD_signal': macd.macd_signal()}
+
+# Полосы Боллинджера
+def compute_bollinger_bands(df):
+    bb = BollingerBands(close=df['price'], window=20, window_dev=2)
+    return {
+        'BB_upper': bb.bollinger_hband(),
+        'BB_middle': bb.bollinger_mavg(),
+        'BB_lower': bb.bollinger_lband(),
+    }
+
+# Стохастический осциллятор
+def compute_stochastic(df):
+    stoch = StochasticOscillator(
+        high=df['high'], low=df['low'], close=df['price'], window=14
+    )
+    return {'STOCHk': stoch.stoch(), 'STOCHd': stoch.stoch_signal()}
+
+# Реестр индикаторов: входные столбцы, выходные столбцы, глубина истории (lookback)
+# и дополнительный разгон (warmup) для индикаторов с экспоненциальным сглаживанием, в барах
+INDICATORS = {
+    'sma': {
+        'inputs': ['price'],
+        'outputs': ['SMA_20', 'SMA_50'],
+        'lookback': 50,
+        'warmup': 0,
+        'compute': lambda df: {
+            'SMA_20': df['price'].rolling(window=20).mean(),
+            'SMA_50': df['price'].rolling(window=50).mean(),
+        },
+    },
+    'ema': {
+        'inputs': ['price'],
+        'outputs': ['EMA_20', 'EMA_50'],
+        'lookback': 50,
+        'warmup': 100,
+        'compute': lambda df: {
+            'EMA_20': EMAIndicator(close=df['price'], window=20).ema_indicator(),
+            'EMA_50': EMAIndicator(close=df['price'], window=50).ema_indicator(),
+        },
+    },
+    'rsi': {
+        'inputs': ['price'],
+        'outputs': ['RSI'],
+        'lookback': 14,
+        'warmup': 50,
+        'compute': lambda df: {'RSI': RSIIndicator(close=df['price'], window=14).rsi()},
+    },
+    'macd': {
+        'inputs': ['price'],
+        'outputs': ['MACD', 'MACD_signal'],
+        'lookback': 26 + 9,
+        'warmup': 50,
+        'compute': compute_macd,
+    },
+    'bollinger': {
+        'inputs': ['price'],
+        'outputs': ['BB_upper', 'BB_middle', 'BB_lower'],
+        'lookback': 20,
+        'warmup': 0,
+        'compute': compute_bollinger_bands,
+    },
+    'cci': {
+        'inputs': ['high', 'low', 'price'],
+        'outputs': ['CCI'],
+        'lookback': 20,
+        'warmup': 0,
+        'compute': lambda df: {
+            'CCI': CCIIndicator(
+                high=df['high'], low=df['low'], close=df['price'], window=20
+            ).cci()
+        },
+    },
+    'stochastic': {
+        'inputs': ['high', 'low', 'price'],
+        'outputs': ['STOCHk', 'STOCHd'],
+        'lookback': 14 + 3,
+        'warmup': 0,
+        'compute': compute_stochastic,
+    },
+    'atr': {
+        'inputs': ['high', 'low', 'price'],
+        'outputs': ['ATR'],
+        'lookback': 14,
+        'warmup': 50,
+        'compute': lambda df: {
+            'ATR': AverageTrueRange(
+                high=df['high'], low=df['low'], close=df['price'], window=14
+            ).average_true_range()
+        },
+    },
+    'obv': {
+        'inputs': ['price', 'volume'],
+        'outputs': ['OBV'],
+        # OBV накапливается с начала ряда, поэтому зависит от всей истории
+        'lookback': 0,
+        'warmup': 0,
+        'compute': lambda df: {
+            'OBV': OnBalanceVolumeIndicator(
+                close=df['price'], volume=df['volume']
+            ).on_balance_volume()
+        },
+    },
+    'adx': {
+        'inputs': ['high', 'low', 'price'],
+        'outputs': ['ADX'],
+        'lookback': 2 * 14,
+        'warmup': 50,
+        'compute': lambda df: {
+            'ADX': ADXIndicator(
+                high=df['high'], low=df['low'], close=df['price'], window=14
+            ).adx()
+        },
+    },
+    'volume_sma': {
+        'inputs': ['volume'],
+        'outputs': ['VOLUME_SMA_20'],
+        'lookback': 20,
+        'warmup': 0,
+        'compute': lambda df: {'VOLUME_SMA_20': df['volume'].rolling(window=20).mean()},
+    },
+}
+
+# Столбцы индикаторов, участвующие в расчете сигналов
+SCORING_OUTPUTS = [
+    'SMA_20',
+    'SMA_50',
+    'EMA_20',
+    'EMA_50',
+    'RSI',
+    'MACD',
+    'MACD_signal',
+    'BB_upper',
+    'BB_lower',
+    'CCI',
+    'STOCHk',
+    'ADX',
+    'VOLUME_SMA_20',
+]
+
+# Функция для выбора индикаторов, дающих нужные столбцы
+def select_indicators(outputs):
+    return [
+        name for name, indicator in INDICATORS.items()
+        if set(indicator['outputs']) & set(outputs)
+    ]
+
+# Функция для расчета глубины истории, нужной выбранным индикаторам (в барах)
+def get_indicator_window(indicator_names):
+    return max(
+        INDICATORS[name]['lookback'] + INDICATORS[name]['warmup']
+        for name in indicator_names
+    )
+
+# Функция для расчета окна анализа в барах для прогноза на forecast_days дней
+def get_analysis_window(forecast_days, bars_per_day):
+    indicator_bars = get_indicator_window(select_indicators(SCORING_OUTPUTS))
+    # Статистика доходностей для прогноза берется за несколько горизонтов
+    return_bars = FORECAST_HISTORY_FACTOR * forecast_days * bars_per_day
+    return max(ANALYSIS_MIN_BARS, ELLIOTT_LOOKBACK, indicator_bars, return_bars)
+
+# Функция для расчета выбранных индикаторов
+def compute_indicators(df, indicator_names):
+    for name in indicator_names:
+        indicator = INDICATORS[name]
+        missing = [column for column in indicator['inputs'] if column not in df.columns]
+        if missing:
+            logging.error(f"Indicator {name} is missing inputs: {missing}")
+            continue
+        for column, series in indicator['compute'](df).items():
+            df[column] = series
+    return df
+
 # Функция для анализа волн Эллиота
 def elliott_wave_analysis(df):
     # Определяем экстремумы
-    order = 5  # Параметр чувствительности
+    order = ELLIOTT_ORDER  # Параметр чувствительности
     df['min'] = df.iloc[
         argrelextrema(df['price'].values, np.less_equal, order=order)[0]
     ]['price']
@@ -582,50 +1300,16 @@ def elliott_wave_analysis(df):
         return "📉 Не удалось определить волны Эллиота."
 
 # Функция для анализа данных и стратегий
-def analyze_data(df, coin_name, forecast_days):
+def analyze_data(
+    df, coin_name, forecast_days, bars_per_day=1, monte_carlo=False, thresholds=()
+):
     if df is None or df.empty:
         return "Нет достаточных данных для анализа."
     # Проверяем, достаточно ли данных
-    if len(df) < 100:
+    if len(df) < ANALYSIS_MIN_BARS:
         return "Недостаточно данных для анализа."
-    # Вычисляем технические индикаторы
-    df['SMA_20'] = df['price'].rolling(window=20).mean()
-    df['SMA_50'] = df['price'].rolling(window=50).mean()
-    df['EMA_20'] = EMAIndicator(close=df['price'], window=20).ema_indicator()
-    df['EMA_50'] = EMAIndicator(close=df['price'], window=50).ema_indicator()
-    df['RSI'] = RSIIndicator(close=df['price'], window=14).rsi()
-    macd = MACD(close=df['price'])
-    df['MACD'] = macd.macd()
-    df['MACD_signal'] = macd.macd_signal()
-    # Полосы Боллинджера
-    bb = BollingerBands(close=df['price'], window=20, window_dev=2)
-    df['BB_upper'] = bb.bollinger_hband()
-    df['BB_middle'] = bb.bollinger_mavg()
-    df['BB_lower'] = bb.bollinger_lband()
-    # Индекс товарного канала (CCI)
-    cci = CCIIndicator(high=df['high'], low=df['low'], close=df['price'], window=20)
-    df['CCI'] = cci.cci()
-    # Стохастический осциллятор
-    stoch = StochasticOscillator(
-        high=df['high'], low=df['low'], close=df['price'], window=14
-    )
-    df['STOCHk'] = stoch.stoch()
-    df['STOCHd'] = stoch.stoch_signal()
-    # Средний истинный диапазон (ATR)
-    atr = AverageTrueRange(
-        high=df['high'], low=df['low'], close=df['price'], window=14
-    )
-    df['ATR'] = atr.average_true_range()
-    # Индикатор объема баланса (OBV)
-    obv_indicator = OnBalanceVolumeIndicator(
-        close=df['price'], volume=df['volume']
-    )
-    df['OBV'] = obv_indicator.on_balance_volume()
-    # Средний индекс направленного движения (ADX)
-    adx_indicator = ADXIndicator(
-        high=df['high'], low=df['low'], close=df['price'], window=14
-    )
-    df['ADX'] = adx_indicator.adx()
+    # Вычисляем только индикаторы, участвующие в расчете сигналов
+    df = compute_indicators(df, select_indicators(SCORING_OUTPUTS))
     # Генерируем сигналы на основе индикаторов
     signals = []
     bullish_weighted_signals = 0
@@ -710,7 +1394,7 @@ def analyze_data(df, coin_name, forecast_days):
         bearish_weighted_signals += weight_elliott
     # Анализ объема торгов
     weight_volume = 1
-    avg_volume = df['volume'].rolling(window=20).mean().iloc[-1]
+    avg_volume = df['VOLUME_SMA_20'].iloc[-1]
     if df['volume'].iloc[-1] > avg_volume:
         signals.append("📈 Объем торгов выше среднего (подтверждение тренда).")
         bullish_weighted_signals += weight_volume
@@ -748,11 +1432,12 @@ def analyze_data(df, coin_name, forecast_days):
         bearish_probability = (bearish_weighted_signals / total_weighted_signals) * 100
     # Рассчитываем прогнозируемую цену
     last_price = df['price'].iloc[-1]
-    df['daily_return'] = df['price'].pct_change()
     df['log_return'] = np.log(df['price'] / df['price'].shift(1))
-    # Рассчитываем среднюю логарифмическую доходность и стандартное отклонение
-    avg_log_return = df['log_return'].mean()
-    std_log_return = df['log_return'].std()
+    # Рассчитываем среднюю логарифмическую доходность и стандартное отклонение.
+    # Статистика считается по барам, переводим ее в дневную: среднее растет
+    # линейно с числом баров, стандартное отклонение - как квадратный корень
+    avg_log_return = df['log_return'].mean() * bars_per_day
+    std_log_return = df['log_return'].std() * np.sqrt(bars_per_day)
     # Определяем фактор настроения на основе сигналов
     if total_weighted_signals == 0:
         sentiment_factor = 0
@@ -762,6 +1447,8 @@ def analyze_data(df, coin_name, forecast_days):
         ) / total_weighted_signals
     # Корректируем среднюю доходность
     adjusted_log_return = avg_log_return + sentiment_factor * std_log_return
+    # Горизонт в барах для вероятностного прогноза
+    forecast_bars = forecast_days * bars_per_day
     # Прогнозируемая цена
     forecasted_price = last_price * np.exp(adjusted_log_return * forecast_days)
     # Ожидаемое процентное изменение цены
@@ -786,59 +1473,641 @@ def analyze_data(df, coin_name, forecast_days):
         f"\n💱 Прогнозируемая цена через {forecast_days} дней: "
         f"${forecasted_price} ({expected_percentage_change:+.2f}%)"
     )
+    if monte_carlo:
+        forecast_info += format_monte_carlo_forecast(
+            last_price, df['log_return'].values, forecast_days, forecast_bars, thresholds
+        )
     return prediction + conclusion + price_info + forecast_info
 
+# Функция для симуляции ценовых траекторий методом Монте-Карло
+def simulate_price_paths(
+    last_price, log_returns, steps, n_paths=MONTE_CARLO_PATHS, bootstrap=False, thresholds=()
+):
+    rng = np.random.default_rng()
+    log_returns = log_returns[np.isfinite(log_returns)]
+    # Объединяем бары в шаги, чтобы матрица путей оставалась в бюджете времени.
+    # Шаги состоят из целого числа баров и в сумме дают ровно steps баров
+    steps = max(1, int(steps))
+    n_steps = min(steps, MONTE_CARLO_MAX_STEPS)
+    bars_per_step = np.full(n_steps, steps // n_steps)
+    bars_per_step[:steps % n_steps] += 1
+    if bootstrap:
+        # Доходности шага берем из перекрывающихся сумм исторических доходностей той же длины
+        increments = np.empty((n_paths, n_steps))
+        for length in np.unique(bars_per_step):
+            columns = bars_per_step == length
+            step_returns = np.convolve(log_returns, np.ones(length), mode='valid')
+            increments[:, columns] = rng.choice(step_returns, size=(n_paths, columns.sum()))
+    else:
+        increments = rng.standard_normal((n_paths, n_steps))
+        increments *= log_returns.std() * np.sqrt(bars_per_step)
+        increments += log_returns.mean() * bars_per_step
+    paths = np.cumsum(increments, axis=1, out=increments)
+    final_prices = last_price * np.exp(paths[:, -1])
+    quantiles = dict(zip((5, 25, 50, 75, 95), np.percentile(final_prices, [5, 25, 50, 75, 95])))
+    # Вероятность того, что цена хотя бы раз отклонится на порог вверх или вниз
+    # от текущей цены (проверяется в конце каждого шага, а не по скользящему окну сигнала)
+    crossings = {}
+    if thresholds:
+        max_path = paths.max(axis=1)
+        min_path = paths.min(axis=1)
+        for percentage in thresholds:
+            up = np.log1p(percentage / 100)
+            down = np.log1p(-percentage / 100) if percentage < 100 else -np.inf
+            crossings[percentage] = np.mean((max_path >= up) | (min_path <= down))
+    return quantiles, crossings
+
+# Функция для форматирования вероятностного прогноза
+def format_monte_carlo_forecast(last_price, log_returns, forecast_days, forecast_bars, thresholds):
+    started = time.perf_counter()
+    quantiles, crossings = simulate_price_paths(
+        last_price,
+        log_returns,
+        forecast_bars,
+        bootstrap=MONTE_CARLO_BOOTSTRAP,
+        thresholds=thresholds,
+    )
+    elapsed = time.perf_counter() - started
+    if elapsed > MONTE_CARLO_BUDGET:
+        logging.warning(f"Monte Carlo simulation took {elapsed * 1000:.0f} ms")
+    text = (
+        f"\n\n🎲 Распределение цены через {forecast_days} дней "
+        f"(по исторической доходности, {MONTE_CARLO_PATHS} сценариев):"
+        f"\nМедиана: ${quantiles[50]:.4f}"
+        f"\n50% интервал: ${quantiles[25]:.4f} – ${quantiles[75]:.4f}"
+        f"\n90% интервал: ${quantiles[5]:.4f} – ${quantiles[95]:.4f}"
+    )
+    if crossings:
+        text += "\nВероятность хотя бы раз отклониться от текущей цены на порог ваших сигналов:"
+    for percentage, probability in crossings.items():
+        text += f"\n🔔 ±{percentage}% за период: {probability * 100:.1f}%"
+    return text
+
+# Функция для сбора сигналов всех пользователей по монетам
+def collect_signal_watchers(application):
+    watchers = {}
+    for user_id, user_data in application.user_data.items():
+        for signal in user_data.get('signals', []):
+            watchers.setdefault(signal['coin'], []).append((user_id, signal))
+    return watchers
+
+# Функция для расчета изменения цены за временной интервал сигнала
+def get_price_change(df, time_frame):
+    current_price = df['price'].iloc[-1]
+    time_delta = TIME_FRAME_DELTAS.get(time_frame, pd.Timedelta(hours=1))
+    past_time = df.index[-1] - time_delta
+    past_prices = df[df.index <= past_time]
+    if past_prices.empty:
+        return None
+    past_price = past_prices['price'].iloc[-1]
+    return (current_price - past_price) / past_price * 100
+
+# Функция для получения максимального интервала проверки монеты
+def get_base_check_interval(coin_signals):
+    return min(
+        TIME_FRAME_CHECK_INTERVALS.get(
+            signal['time_frame'], TIME_FRAME_CHECK_INTERVALS['1h']
+        )
+        for _, signal in coin_signals
+    )
+
+# Функция для расчета времени до следующей проверки монеты
+def get_next_check_interval(df, coin_signals, price_changes):
+    base_interval = get_base_check_interval(coin_signals)
+    # Расстояние (в процентных пунктах) до ближайшего порога
+    distances = [
+        signal['percentage'] - abs(price_change)
+        for (_, signal), price_change in zip(coin_signals, price_changes)
+        if price_change is not None
+    ]
+    if not distances:
+        return base_interval
+    distance = min(distances)
+    if distance <= 0:
+        # Сигнал уже сработал, проверяем с обычной частотой
+        return base_interval
+    # Волатильность одного 5-минутного бара в процентах
+    log_returns = np.log(df['price'] / df['price'].shift(1)).dropna()
+    volatility = log_returns.std() * 100
+    if pd.isna(volatility) or volatility == 0:
+        return base_interval
+    # Для случайного блуждания время до сдвига на distance растет как (distance / volatility)^2
+    expected_seconds = (distance / volatility) ** 2 * PRICE_BAR_SECONDS
+    interval = expected_seconds * SIGNAL_CHECK_SAFETY_FACTOR
+    return int(min(base_interval, max(MIN_SIGNAL_CHECK_INTERVAL, interval)))
+
+# Функция для получения текста уведомления о сработавшем сигнале
+def get_signal_alert_text(coin_dict, coin, time_frame, price_change):
+    coin_ticker = [k for k, v in coin_dict.items() if v == coin]
+    if coin_ticker:
+        coin_ticker = coin_ticker[0].upper()
+    else:
+        coin_ticker = coin.capitalize()
+    direction = 'выросла' if price_change > 0 else 'упала'
+    time_frame_texts = {
+        '1h': '1 час',
+        '4h': '4 часа',
+        '12h': '12 часов',
+        '24h': '1 день',
+    }
+    time_frame_text = time_frame_texts.get(time_frame, time_frame)
+    return (
+        f"🚨 Цена {coin_ticker} {direction} на {price_change:.2f}% "
+        f"за последние {time_frame_text}!"
+    )
+
+# Функция для проверки монет, чья очередь подошла, и отправки уведомлений
+async def process_signal_schedule(bot, schedule, watchers, coin_dict):
+    now = time.monotonic()
+    # Количество монет, ожидающих проверки к началу прохода
+    backlog = sum(1 for due_time in schedule['due'].values() if due_time <= now)
+    # Набор сигналов по каждой монете на момент прошлого прохода
+    signatures = schedule.setdefault('signatures', {})
+    for coin, coin_signals in watchers.items():
+        signature = sorted(
+            (user_id, signal['time_frame'], signal['percentage'])
+            for user_id, signal in coin_signals
+        )
+        if coin not in schedule['due']:
+            # Монеты с новыми сигналами проверяем сразу
+            due_time = now
+        elif signatures.get(coin) != signature:
+            # Сигналы изменились: проверка не должна ждать дольше нового интервала
+            due_time = min(schedule['due'][coin], now + get_base_check_interval(coin_signals))
+        else:
+            due_time = None
+        signatures[coin] = signature
+        if due_time is not None and due_time != schedule['due'].get(coin):
+            schedule['due'][coin] = due_time
+            heapq.heappush(schedule['queue'], (due_time, coin))
+    while schedule['queue'] and schedule['queue'][0][0] <= now:
+        due_time, coin = heapq.heappop(schedule['queue'])
+        if schedule['due'].get(coin) != due_time:
+            # Устаревшая запись очереди
+            continue
+        coin_signals = watchers.get(coin)
+        if not coin_signals:
+            # Монеты без сигналов не опрашиваем
+            del schedule['due'][coin]
+            signatures.pop(coin, None)
+            continue
+        # Для сигналов берем самый мелкий уровень, покрывающий их таймфреймы
+        history = max(
+            TIME_FRAME_DELTAS.get(signal['time_frame'], pd.Timedelta(hours=1))
+            for _, signal in coin_signals
+        )
+        interval = get_base_check_interval(coin_signals)
+        try:
+            df = await asyncio.to_thread(get_price_level, coin, select_price_level(history))
+            if df is not None and not df.empty:
+                price_changes = []
+                for user_id, signal in coin_signals:
+                    percentage = signal['percentage']
+                    time_frame = signal['time_frame']
+                    price_change = get_price_change(df, time_frame)
+                    price_changes.append(price_change)
+                    if price_change is None:
+                        continue
+                    if abs(price_change) >= percentage:
+                        message = get_signal_alert_text(coin_dict, coin, time_frame, price_change)
+                        try:
+                            await bot.send_message(chat_id=user_id, text=message)
+                        except Exception as e:
+                            logging.error(f"Error sending signal alert to {user_id}: {e}")
+                        # Опционально, можно удалить сигнал после срабатывания
+                        # user_data['signals'].remove(signal)
+                interval = get_next_check_interval(df, coin_signals, price_changes)
+        finally:
+            # Монета всегда возвращается в очередь, даже если проверка упала
+            next_due = time.monotonic() + interval
+            schedule['due'][coin] = next_due
+            heapq.heappush(schedule['queue'], (next_due, coin))
+    return backlog
+
 # Функция для проверки пользовательских сигналов и отправки уведомлений
 async def check_user_signals(context: ContextTypes.DEFAULT_TYPE):
-    coin_dict = context.bot_data['coin_dict']
-    for user_id, user_data in context.application.user_data.items():
-        if 'signals' in user_data:
-            for signal in user_data['signals']:
-                coin = signal['coin']
-                percentage = signal['percentage']
-                time_frame = signal['time_frame']
-                df = get_price_data(coin, days=1)
-                if df is None or df.empty:
-                    continue
-                current_price = df['price'].iloc[-1]
-                time_deltas = {
-                    '1h': pd.Timedelta(hours=1),
-                    '4h': pd.Timedelta(hours=4),
-                    '12h': pd.Timedelta(hours=12),
-                    '24h': pd.Timedelta(hours=24),
-                }
-                time_delta = time_deltas.get(time_frame, pd.Timedelta(hours=1))
-                past_time = df.index[-1] - time_delta
-                past_prices = df[df.index <= past_time]
-                if past_prices.empty:
-                    continue
-                past_price = past_prices['price'].iloc[-1]
-                price_change = (current_price - past_price) / past_price * 100
-                if abs(price_change) >= percentage:
-                    coin_ticker = [k for k, v in coin_dict.items() if v == coin]
-                    if coin_ticker:
-                        coin_ticker = coin_ticker[0].upper()
-                    else:
-                        coin_ticker = coin.capitalize()
-                    direction = 'выросла' if price_change > 0 else 'упала'
-                    time_frame_texts = {
-                        '1h': '1 час',
-                        '4h': '4 часа',
-                        '12h': '12 часов',
-                        '24h': '1 день',
-                    }
-                    time_frame_text = time_frame_texts.get(time_frame, time_frame)
-                    message = (
-                        f"🚨 Цена {coin_ticker} {direction} на {price_change:.2f}% "
-                        f"за последние {time_frame_text}!"
-                    )
-                    await context.bot.send_message(chat_id=user_id, text=message)
-                    # Опционально, можно удалить сигнал после срабатывания
-                    # user_data['signals'].remove(signal)
+    # Очередь с приоритетом: (время следующей проверки, монета)
+    schedule = context.bot_data.setdefault('signal_schedule', {'queue': [], 'due': {}})
+    watchers = collect_signal_watchers(context.application)
+    # Монеты, цены которых приходят из потока, проверяются по тикам
+    stream = context.bot_data.get('price_stream')
+    if stream is not None:
+        watchers = {
+            coin: coin_signals
+            for coin, coin_signals in watchers.items()
+            if not is_coin_streamed(stream, coin, coin_signals)
+        }
+    await process_signal_schedule(
+        context.bot, schedule, watchers, context.bot_data['coin_dict']
+    )
+
+# Функция для получения текущих цен нескольких монет одним запросом
+def get_simple_prices(coins):
+    url = 'https://api.coingecko.com/api/v3/simple/price'
+    params = {
+        'ids': ','.join(coins),
+        'vs_currencies': 'usd',
+        'include_last_updated_at': 'true',
+    }
+    try:
+        response = requests.get(url, params=params, timeout=10)
+        response.raise_for_status()
+        data = response.json()
+        return {
+            coin: (values['last_updated_at'], values['usd'])
+            for coin, values in data.items()
+            if 'usd' in values
+        }
+    except Exception as e:
+        logging.error(f"Error fetching simple prices: {e}")
+        return {}
+
+# Источник цен: периодический опрос CoinGecko
+async def poll_price_ticks(get_coins, coin_dict):
+    while True:
+        coins = get_coins()
+        if coins:
+            prices = await asyncio.to_thread(get_simple_prices, coins)
+            for coin, (timestamp, price) in prices.items():
+                yield coin, timestamp, price
+        await asyncio.sleep(PRICE_POLL_INTERVAL)
+
+# Источник цен: поток мини-тикеров Binance (пары к USDT)
+async def stream_binance_ticks(get_coins, coin_dict):
+    coins = set(get_coins())
+    symbols = {
+        f"{ticker.upper()}USDT": coin for ticker, coin in coin_dict.items() if coin in coins
+    }
+    if not symbols:
+        await asyncio.sleep(SIGNAL_SCHEDULER_TICK)
+        return
+    streams = '/'.join(f"{symbol.lower()}@miniTicker" for symbol in symbols)
+    url = f"wss://stream.binance.com:9443/stream?streams={streams}"
+    async with websockets.connect(url) as ws:
+        resubscribe_check = time.monotonic() + SIGNAL_SCHEDULER_TICK
+        while True:
+            try:
+                message = await asyncio.wait_for(ws.recv(), timeout=SIGNAL_SCHEDULER_TICK)
+            except asyncio.TimeoutError:
+                message = None
+            if message is not None:
+                data = json.loads(message).get('data', {})
+                coin = symbols.get(data.get('s'))
+                if coin:
+                    yield coin, data['E'] / 1000, float(data['c'])
+            if time.monotonic() >= resubscribe_check:
+                # Набор монет изменился: переподключаемся с новыми подписками
+                if set(get_coins()) != coins:
+                    return
+                resubscribe_check = time.monotonic() + SIGNAL_SCHEDULER_TICK
+
+# Источник цен: локальное моделирование случайного блуждания (для тестов)
+async def simulate_price_ticks(
+    get_coins, coin_dict, start_prices=None, volatility=0.001, interval=0.5, seed=None
+):
+    rng = np.random.default_rng(seed)
+    prices = dict(start_prices or {})
+    while True:
+        for coin in get_coins():
+            prices[coin] = prices.get(coin, 100.0) * np.exp(rng.normal(0, volatility))
+            yield coin, time.time(), prices[coin]
+        await asyncio.sleep(interval)
+
+# Источники цен: асинхронные генераторы тиков (монета, время, цена)
+PRICE_SOURCES = {
+    'binance': stream_binance_ticks,
+    'poll': poll_price_ticks,
+    'simulated': simulate_price_ticks,
+}
+
+# Функция для построения отсортированного индекса порогов:
+# {coin: {time_frame: {'percentages': [...], 'signals': [(percentage, user_id, signal)]}}}
+def build_threshold_index(watchers):
+    index = {}
+    for coin, coin_signals in watchers.items():
+        for user_id, signal in coin_signals:
+            entries = index.setdefault(coin, {}).setdefault(signal['time_frame'], [])
+            entries.append((signal['percentage'], user_id, signal))
+    for coin_index in index.values():
+        for time_frame, entries in coin_index.items():
+            entries.sort(key=lambda entry: entry[0])
+            coin_index[time_frame] = {
+                'percentages': [entry[0] for entry in entries],
+                'signals': entries,
+            }
+    return index
+
+# Функция для обновления индекса порогов после изменения сигналов
+def refresh_threshold_index(application, stream):
+    if stream['index_dirty'] or time.monotonic() - stream['index_built'] > SIGNAL_SCHEDULER_TICK:
+        stream['index'] = build_threshold_index(collect_signal_watchers(application))
+        stream['index_built'] = time.monotonic()
+        stream['index_dirty'] = False
+
+# Функция для пометки индекса порогов как устаревшего
+def mark_signals_changed(bot_data):
+    if 'price_stream' in bot_data:
+        bot_data['price_stream']['index_dirty'] = True
+
+# Функция для проверки, покрывает ли поток цен сигналы монеты
+def is_coin_streamed(stream, coin, coin_signals):
+    state = stream['coins'].get(coin)
+    if state is None or not state['times']:
+        return False
+    if time.time() - state['updated'] > STREAM_STALE_SECONDS:
+        return False
+    history = max(
+        TIME_FRAME_DELTAS.get(signal['time_frame'], pd.Timedelta(hours=1))
+        for _, signal in coin_signals
+    ).total_seconds()
+    return state['times'][0] <= state['times'][-1] - history
+
+# Функция для заполнения истории монеты из пирамиды цен
+def load_stream_history(coin):
+    df = get_price_level(coin, '5min')
+    if df is None or df.empty:
+        return [], []
+    times = (df.index - pd.Timestamp(0)) / pd.Timedelta(seconds=1)
+    return list(times), list(df['price'])
+
+# Функция для обработки тика цены и проверки затронутых сигналов
+async def on_price_tick(application, stream, coin, timestamp, price):
+    state = stream['coins'].get(coin)
+    if state is None:
+        times, prices = [], []
+        if stream['seed_history']:
+            times, prices = await asyncio.to_thread(load_stream_history, coin)
+        state = stream['coins'][coin] = {'times': times, 'prices': prices, 'updated': 0}
+    times, prices = state['times'], state['prices']
+    if not times or timestamp - times[-1] >= STREAM_HISTORY_SPACING:
+        times.append(timestamp)
+        prices.append(price)
+        if times[0] < timestamp - STREAM_HISTORY_SECONDS - 3600:
+            cut = bisect.bisect_left(times, timestamp - STREAM_HISTORY_SECONDS)
+            del times[:cut]
+            del prices[:cut]
+    state['updated'] = time.time()
+    now = time.monotonic()
+    for time_frame, entries in stream['index'].get(coin, {}).items():
+        time_delta = TIME_FRAME_DELTAS.get(time_frame, pd.Timedelta(hours=1))
+        pos = bisect.bisect_right(times, timestamp - time_delta.total_seconds())
+        if pos == 0:
+            continue
+        past_price = prices[pos - 1]
+        price_change = (price - past_price) / past_price * 100
+        # Сработать могут только сигналы с порогом не выше текущего изменения
+        triggered = bisect.bisect_right(entries['percentages'], abs(price_change))
+        cooldown = TIME_FRAME_CHECK_INTERVALS.get(time_frame, TIME_FRAME_CHECK_INTERVALS['1h'])
+        for percentage, user_id, signal in entries['signals'][:triggered]:
+            key = (user_id, coin, time_frame, percentage)
+            if now - stream['alerts'].get(key, -cooldown) < cooldown:
+                continue
+            stream['alerts'][key] = now
+            message = get_signal_alert_text(
+                application.bot_data['coin_dict'], coin, time_frame, price_change
+            )
+            # Ошибка отправки одному пользователю не должна обрывать поток цен
+            try:
+                await application.bot.send_message(chat_id=user_id, text=message)
+            except Exception as e:
+                logging.error(f"Error sending signal alert to {user_id}: {e}")
+
+# Фоновая задача: получение тиков из выбранного источника с переподключением
+async def run_price_stream(application):
+    stream = application.bot_data['price_stream']
+    source = PRICE_SOURCES[PRICE_SOURCE]
+
+    # Источники запрашивают список монет и в паузах без тиков, поэтому индекс
+    # обновляется здесь: иначе сигналы, добавленные при пустом индексе, не видны
+    def get_coins():
+        refresh_threshold_index(application, stream)
+        return list(stream['index'])
+
+    retry_delay = 1
+    while True:
+        try:
+            async for coin, timestamp, price in source(
+                get_coins, application.bot_data['coin_dict']
+            ):
+                refresh_threshold_index(application, stream)
+                await on_price_tick(application, stream, coin, timestamp, price)
+                retry_delay = 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Price stream error: {e}")
+            retry_delay = min(retry_delay * 2, 300)
+        await asyncio.sleep(retry_delay)
+
+# Запуск потока цен после инициализации приложения
+async def start_price_stream(application):
+    application.bot_data['price_stream'] = {
+        'coins': {},
+        'index': {},
+        'index_built': 0,
+        'index_dirty': True,
+        'alerts': {},
+        # Для моделируемого источника история из API не нужна
+        'seed_history': PRICE_SOURCE != 'simulated',
+    }
+    application.bot_data['price_stream']['task'] = asyncio.create_task(
+        run_price_stream(application)
+    )
+
+# Остановка потока цен при завершении приложения
+async def stop_price_stream(application):
+    task = application.bot_data.get('price_stream', {}).get('task')
+    if task is not None:
+        task.cancel()
+
+# Функция для открытия общего хранилища шардов
+def open_shard_store():
+    conn = sqlite3.connect(SIGNAL_SHARD_DB, timeout=30)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS signals (user_id INTEGER, coin TEXT, signal TEXT)'
+    )
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS workers ('
+        'worker_id TEXT PRIMARY KEY, heartbeat REAL, sweep_duration REAL, '
+        'backlog INTEGER, coins INTEGER)'
+    )
+    conn.commit()
+    return conn
+
+# Функция для публикации сигналов пользователей в общее хранилище
+def save_signal_watchers(conn, watchers):
+    rows = [
+        (user_id, coin, json.dumps(signal))
+        for coin, coin_signals in watchers.items()
+        for user_id, signal in coin_signals
+    ]
+    with conn:
+        conn.execute('DELETE FROM signals')
+        conn.executemany('INSERT INTO signals VALUES (?, ?, ?)', rows)
+
+# Функция для загрузки сигналов пользователей из общего хранилища
+def load_signal_watchers(conn):
+    watchers = {}
+    for user_id, coin, signal in conn.execute('SELECT user_id, coin, signal FROM signals'):
+        watchers.setdefault(coin, []).append((user_id, json.loads(signal)))
+    return watchers
+
+# Функция для обновления heartbeat и статистики воркера
+def report_worker_status(conn, worker_id, sweep_duration, backlog, coins):
+    with conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO workers VALUES (?, ?, ?, ?, ?)',
+            (worker_id, time.time(), sweep_duration, backlog, coins),
+        )
+
+# Функция для получения списка живых воркеров (умершие удаляются)
+def get_live_workers(conn):
+    expired = time.time() - SIGNAL_SHARD_LEASE
+    with conn:
+        conn.execute('DELETE FROM workers WHERE heartbeat < ?', (expired,))
+    return [row[0] for row in conn.execute('SELECT worker_id FROM workers')]
+
+def get_shard_hash(key):
+    return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+# Функция для построения кольца консистентного хеширования
+def build_hash_ring(worker_ids):
+    return sorted(
+        (get_shard_hash(f"{worker_id}#{vnode}"), worker_id)
+        for worker_id in worker_ids
+        for vnode in range(SIGNAL_SHARD_VNODES)
+    )
+
+# Функция для определения воркера, отвечающего за монету
+def get_shard_owner(ring, coin):
+    if not ring:
+        return None
+    idx = bisect.bisect(ring, (get_shard_hash(coin),)) % len(ring)
+    return ring[idx][1]
+
+# Публикация сигналов для воркеров в шардированном режиме
+async def publish_user_signals(context: ContextTypes.DEFAULT_TYPE):
+    # Сигналы собираем в потоке цикла событий, а запись в SQLite, которая может
+    # ждать блокировку воркеров, выполняем в отдельном потоке
+    watchers = collect_signal_watchers(context.application)
+    await asyncio.to_thread(write_signal_watchers, watchers)
+
+# Функция для записи сигналов в общее хранилище
+def write_signal_watchers(watchers):
+    conn = open_shard_store()
+    try:
+        save_signal_watchers(conn, watchers)
+    finally:
+        conn.close()
+
+# Процесс-воркер, обрабатывающий свою часть монет
+async def run_signal_worker(worker_id):
+    conn = open_shard_store()
+    coin_dict = get_top_coins()
+    schedule = {'queue': [], 'due': {}}
+    sweep_duration = 0
+    backlog = 0
+    async with Bot(TELEGRAM_BOT_TOKEN) as bot:
+        while True:
+            started = time.monotonic()
+            report_worker_status(conn, worker_id, sweep_duration, backlog, len(schedule['due']))
+            # Кольцо пересчитывается каждый проход, поэтому монеты умершего воркера
+            # переходят к живым после истечения его аренды
+            ring = build_hash_ring(get_live_workers(conn))
+            watchers = {
+                coin: coin_signals
+                for coin, coin_signals in load_signal_watchers(conn).items()
+                if get_shard_owner(ring, coin) == worker_id
+            }
+            backlog = await process_signal_schedule(bot, schedule, watchers, coin_dict)
+            sweep_duration = time.monotonic() - started
+            report_worker_status(conn, worker_id, sweep_duration, backlog, len(watchers))
+            logging.info(
+                f"Signal worker {worker_id}: {len(watchers)} coins, "
+                f"sweep {sweep_duration:.2f}s, backlog {backlog}"
+            )
+            await asyncio.sleep(SIGNAL_SCHEDULER_TICK)
+
+# Приложение, обрабатывающее обновления разных пользователей параллельно.
+# Обновления одного пользователя выполняются строго по порядку, поэтому состояния
+# ConversationHandler и user_data не изменяются одновременно.
+class OrderedConcurrentApplication(Application):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.update_semaphore = asyncio.Semaphore(UPDATE_CONCURRENCY_LIMIT)
+        self.user_update_locks = {}
+        # Глубина очереди по пользователям с необработанными обновлениями
+        # (запись удаляется, когда очередь пользователя пустеет)
+        self.update_queue_stats = {}
+        # Сводка ожиданий за текущий интервал отчета
+        self.update_queue_summary = new_update_queue_summary()
+
+    async def process_update(self, update):
+        user = update.effective_user if isinstance(update, Update) else None
+        if user is None:
+            async with self.update_semaphore:
+                return await super().process_update(update)
+        stats = self.update_queue_stats.setdefault(user.id, {'depth': 0})
+        stats['depth'] += 1
+        summary = self.update_queue_summary
+        summary['max_depth'] = max(summary['max_depth'], stats['depth'])
+        lock = self.user_update_locks.setdefault(user.id, asyncio.Lock())
+        queued = time.monotonic()
+        try:
+            # Сначала ждем своей очереди, и только потом занимаем общий слот,
+            # чтобы обновления одного пользователя не занимали слоты других
+            async with lock:
+                async with self.update_semaphore:
+                    wait = time.monotonic() - queued
+                    summary = self.update_queue_summary
+                    summary['updates'] += 1
+                    summary['total_wait'] += wait
+                    summary['max_wait'] = max(summary['max_wait'], wait)
+                    if wait > SLOW_UPDATE_WAIT:
+                        summary['slow'] += 1
+                        logging.warning(
+                            f"Update for user {user.id} waited {wait:.2f}s "
+                            f"(queue depth {stats['depth']})"
+                        )
+                    await super().process_update(update)
+        finally:
+            stats['depth'] -= 1
+            if stats['depth'] == 0:
+                self.update_queue_stats.pop(user.id, None)
+                self.user_update_locks.pop(user.id, None)
+
+# Функция для создания пустой сводки очередей обновлений
+def new_update_queue_summary():
+    return {'updates': 0, 'slow': 0, 'max_depth': 0, 'total_wait': 0.0, 'max_wait': 0.0}
+
+# Функция для периодического отчета об очередях обновлений
+async def report_update_queues(context: ContextTypes.DEFAULT_TYPE):
+    application = context.application
+    summary = application.update_queue_summary
+    application.update_queue_summary = new_update_queue_summary()
+    avg_wait = summary['total_wait'] / summary['updates'] if summary['updates'] else 0.0
+    logging.info(
+        f"Update queues: {summary['updates']} updates, {summary['slow']} slow, "
+        f"avg wait {avg_wait:.2f}s, max wait {summary['max_wait']:.2f}s, "
+        f"max depth {summary['max_depth']}, "
+        f"{len(application.update_queue_stats)} users queued now"
+    )
 
 # Основная функция
-def main():
-    application = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN).build()
+def main(sharded=False):
+    builder = (
+        ApplicationBuilder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .application_class(OrderedConcurrentApplication)
+        # Общий лимит задается UPDATE_CONCURRENCY_LIMIT внутри приложения
+        .concurrent_updates(True)
+    )
+    if not sharded:
+        # Поток цен для мгновенной проверки сигналов (в шардированном режиме
+        # сигналы проверяют воркеры)
+        builder = builder.post_init(start_price_stream).post_shutdown(stop_price_stream)
+    application = builder.build()
     # Сохраняем список монет в bot_data
     application.bot_data['coin_dict'] = get_top_coins()
 
@@ -879,10 +2148,38 @@ def main():
     # Обработчик текстовых сообщений (для ввода процентов)
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, set_price_change_params))
 
-    # Проверяем пользовательские сигналы каждые 5 минут
-    application.job_queue.run_repeating(check_user_signals, interval=300, first=0)
+    if sharded:
+        # Сигналы проверяют отдельные процессы-воркеры (--signal-worker)
+        application.job_queue.run_repeating(
+            publish_user_signals, interval=SIGNAL_SCHEDULER_TICK, first=0
+        )
+    else:
+        # Планировщик сигналов: каждая монета проверяется, когда подходит ее очередь
+        application.job_queue.run_repeating(
+            check_user_signals, interval=SIGNAL_SCHEDULER_TICK, first=0
+        )
+
+    # Обновляем настроение новостей каждые 10 минут
+    application.job_queue.run_repeating(
+        update_news_sentiment, interval=NEWS_REFRESH_INTERVAL, first=0
+    )
+
+    # Периодический отчет об очередях обновлений пользователей
+    application.job_queue.run_repeating(
+        report_update_queues, interval=UPDATE_QUEUE_REPORT_INTERVAL,
+        first=UPDATE_QUEUE_REPORT_INTERVAL
+    )
 
     application.run_polling()
 
+# Запуск:
+#   python progn.py                          - бот с проверкой сигналов в одном процессе
+#   python progn.py --sharded                - бот, публикующий сигналы для воркеров
+#   python progn.py --signal-worker [ID]     - воркер сигналов (по умолчанию ID = хост-pid)
+# Шардированный режим на одном хосте: honcho start -f Procfile.sharded -c signal_worker=4
 if __name__ == '__main__':
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] == '--signal-worker':
+        worker_id = sys.argv[2] if len(sys.argv) > 2 else f"{socket.gethostname()}-{os.getpid()}"
+        asyncio.run(run_signal_worker(worker_id))
+    else:
+        main(sharded='--sharded' in sys.argv)